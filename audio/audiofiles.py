@@ -47,6 +47,8 @@ class Audio:
     - ``validate_string``:  A method that checks if a given object is a string under 100 characters.
     - ``validate_duration``:    A method that checks if a given object is a positive integer.
     """
+    __slots__ = ('metadata', 'name', 'duration', 'uploadtime', 'ID')
+
     metadata: dict
 
     def __post_init__(self):
@@ -183,6 +185,8 @@ class Song(Audio):
     - ``validate_string``:  A method that checks if a given object is a string under 100 characters.
     - ``validate_duration``:    A method that checks if a given object is a positive integer.
     """
+    __slots__ = ()
+
     metadata: dict
 
     def __post_init__(self):
@@ -232,6 +236,8 @@ class Podcast(Audio):
     - ``validate_duration``:    A method that checks if a given object is a positive integer.
     - ``validate_participants``:    A method that checks if a given object is a list of valid str.
     """
+    __slots__ = ('host', 'participants')
+
     metadata: dict
 
     def __post_init__(self):
@@ -319,6 +325,8 @@ class Audiobook(Audio):
     - ``validate_string``:  A method that checks if a given object is a string under 100 characters.
     - ``validate_duration``:    A method that checks if a given object is a positive integer.
     """
+    __slots__ = ('author', 'narrator')
+
     metadata: dict
 
     def __post_init__(self):
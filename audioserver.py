@@ -1,236 +1,489 @@
+import hashlib
 import os
-
-from pymongo import MongoClient
-from flask import Flask, request
-from flask_restful import Api, Resource
+import threading
+import time
+from concurrent.futures import Future
+
+import orjson
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
+from flask import Flask, Response, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException
 from audio import Song,Podcast, Audiobook
 from audio import MetadataValueError, MetadataGenerationError
 
-client = MongoClient(os.environ.get('AUDIO_SERVER'))
-collection = client['AudioServer']['audiofiles']
+# MongoClient is not fork-safe: each server worker must import this module after forking
+# (i.e. do not serve with gunicorn --preload), giving one client and pool per worker.
+# maxPoolSize matches worker_connections in gunicorn.conf.py; keep the two in sync.
+# The client connects lazily on first use, and only keeps warm connections open when
+# AUDIO_SERVER_MIN_POOL_SIZE is set (gunicorn.conf.py does), so importing this module
+# for tests or CLI commands never opens a connection.
+client = MongoClient(os.environ.get('AUDIO_SERVER'), connect=False, maxPoolSize=50,
+                     minPoolSize=int(os.environ.get('AUDIO_SERVER_MIN_POOL_SIZE', 0)),
+                     waitQueueTimeoutMS=2000, retryWrites=True, socketTimeoutMS=5000)
+collection = client['AudioServer'].get_collection('audiofiles', write_concern=WriteConcern(w=1, j=False))
+
+_AUDIO_CLASSES = {'Song': Song, 'Podcast': Podcast, 'Audiobook': Audiobook}
+_AUDIO_TYPES = frozenset(_AUDIO_CLASSES)
+
+
+_R400 = {'status': 400, 'message': 'Bad Request', 'error': None}
+_R500 = {'status': 500, 'message': 'Internal Server Error', 'error': None}
 
 
 def generate_400_response(error):
-    return {'status': 400, 'message': 'Bad Request', 'error': error}
+    response = _R400.copy()
+    response['error'] = error
+    return response
 
 
 def generate_500_response(error):
-    return {'status': 500, 'message': 'Internal Server Error', 'error': error}
+    response = _R500.copy()
+    response['error'] = error
+    return response
+
+
+class ReadBatcher:
+    """ Coalesces concurrent single document lookups into one '$in' query per audio type.
+    Lookups that arrive within 'window' seconds of the first pending one are sent together.
+    The queries are issued by a single long-lived flusher thread (a greenlet under gevent),
+    started on the first lookup so that it belongs to the worker process that uses it. """
+
+    def __init__(self, collection, window: float = 0.005):
+        self.collection = collection
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    def find_one(self, audiotype: str, audioID: int):
+        """ Queues a lookup and blocks until its batch has been queried """
+        future = Future()
+
+        with self._lock:
+            if not self._flusher:
+                self._flusher = threading.Thread(target=self._run, name='read-batcher', daemon=True)
+                self._flusher.start()
+
+            self._pending.setdefault(audiotype, []).append((audioID, future))
+            self._wakeup.set()
+
+        return future.result()
+
+    def _run(self):
+        """ Flusher loop: waits for a pending lookup, lets the window fill and then flushes """
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.window)
+            self._flush()
+
+    def _flush(self):
+        """ Issues one query per audio type and hands each waiter its document """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._wakeup.clear()
+
+        for audiotype, waiters in pending.items():
+            try:
+                search = {'type': audiotype, '_id': {'$in': list({audioID for audioID, _ in waiters})}}
+                found = {doc['_id']: doc for doc in self.collection.find(search)}
+
+            except Exception as error:
+                for _, future in waiters:
+                    future.set_exception(error)
+                continue
+
+            for audioID, future in waiters:
+                future.set_result(found.get(audioID))
+
+
+batcher = ReadBatcher(collection) if os.environ.get('AUDIO_SERVER_BATCH_READS') else None
+
+
+def read_batched(audiotype: str, audioID: int):
+    """ Finds a single document, through the read batcher when AUDIO_SERVER_BATCH_READS is set """
+    if batcher:
+        return batcher.find_one(audiotype, audioID)
+
+    return collection.find_one({'type': audiotype, '_id': audioID})
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """ A JSON provider that parses request bodies and serializes responses with orjson """
+
+    def dumps(self, obj, **kwargs):
+        # orjson never sorts keys or indents, so the sort_keys/indent arguments Flask passes
+        # (including its debug-mode pretty-printing) are deliberately ignored
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 
 app = Flask(__name__)
-api = Api(app)
+app.json = OrjsonProvider(app)
+
+
+@app.cli.command('create-indexes')
+def create_indexes():
+    """ Creates the indexes the audio server's queries rely on. Every lookup filters on 'type'
+    (and usually '_id'), so they are backed by a compound index. Safe to re-run, as
+    create_index is a no-op when the index already exists. """
+    # A dedicated client without the serving socketTimeoutMS, as building the index
+    # on a large existing collection can take far longer than a request
+    with MongoClient(os.environ.get('AUDIO_SERVER')) as admin_client:
+        admin_client['AudioServer']['audiofiles'].create_index([('type', 1), ('_id', 1)], name='type_id_idx')
+
+
+@app.errorhandler(HTTPException)
+def handle_http_error(error: HTTPException):
+    """ Returns HTTP errors (malformed bodies, unknown routes, wrong methods) in the JSON
+    response envelope instead of Werkzeug's HTML pages """
+    response = error.get_response()
+    response.data = app.json.dumps({'status': error.code, 'message': error.name, 'error': error.description})
+    response.content_type = 'application/json'
+    return response
+
+
+@app.errorhandler(Exception)
+def handle_unexpected_error(error: Exception):
+    """ Returns any unhandled error as a 500 in the JSON response envelope """
+    response = generate_500_response(f"unhandled error - {error}")
+    return response, 500
+
+
+def _canon_type(audiotype: str):
+    """ Returns the canonical (capitalized) form of an audio type, as used in _AUDIO_TYPES """
+    return audiotype.capitalize()
+
 
 def new_audio(audiotype: str, audiometadata: dict):
     """ A function that generates an Audio object, one of Song, Podcast and Audiobook
-    and returns it. Returns None if the 'audiotype' is invalid. """
+    and returns it. Expects the canonical 'audiotype' from _canon_type() and
+    returns None if it is invalid. Metadata errors
+    raised by the Audio classes propagate to the caller. """
+    audioclass = _AUDIO_CLASSES.get(audiotype)
+    return audioclass(audiometadata) if audioclass else None
+
+
+
+@app.route('/create', methods=['POST'])
+def create():
+    """ View for creating audio files on the server """
+    data = request.get_json(cache=True)
+
+    if not isinstance(data, dict):
+        response = generate_400_response("request body must be a dict")
+        return response,400
+
     try:
-        audiotype = audiotype.lower()
-
-        if audiotype == "song":
-            file = Song(audiometadata)
-        elif audiotype == "podcast":
-            file = Podcast(audiometadata)
-        elif audiotype == "audiobook":
-            file = Audiobook(audiometadata)
-        else:
-            return None
+        audiotype:str = data['audioFileType']
+        audiometadata:dict = data['audioFileMetadata']
+
+    except KeyError as key:
+        response = generate_400_response(f"{key} is required")
+        return response,400
+
+    if not isinstance(audiotype, str):
+        response = generate_400_response("'audioFileType' must be an string")
+        return response,400
+
+    if not isinstance(audiometadata, dict):
+        response = generate_400_response("'audioFileMetadata' must be an dict")
+        return response,400
+
+    audiotype = _canon_type(audiotype)
 
-        return file
+    if audiotype not in _AUDIO_TYPES:
+        response = generate_400_response(f"'{audiotype}' is not supported")
+        return response,400
+
+    try:
+        audiofile = new_audio(audiotype,audiometadata)
 
     except MetadataValueError as error:
-        raise MetadataValueError(error)
+        response = generate_400_response(f"{error}")
+        return response, 400
 
     except MetadataGenerationError as error:
-        raise MetadataGenerationError(error)
+        response = generate_500_response(f"metadata generation for {audiotype} - {error}")
+        return response, 500
+
+    try:
+        insert_result = collection.insert_one(audiofile.metadata)
+
+    except Exception as error:
+        response = generate_500_response(f"database insertion failed - {error}")
+        return response, 500
 
+    return {"status":200,"message":"Creation Completed","result":f"{audiotype} file with ID {insert_result.inserted_id} has been created",
+            "document":insert_result.inserted_id},200
 
+@app.route('/create-batch', methods=['POST'])
+def create_batch():
+    """ View for creating many audio files on the server with a single database write """
+    data = request.get_json(cache=True)
 
-class Create(Resource):
-    def post(self):
-        data = request.get_json()
+    if not isinstance(data, list):
+        response = generate_400_response("request body must be a list")
+        return response, 400
+
+    audiofiles = []
+    for count, item in enumerate(data, start=1):
+        if not isinstance(item, dict):
+            response = generate_400_response(f"item {count} - must be a dict")
+            return response, 400
 
         try:
-            audiotype:str = data['audioFileType']
-            audiometadata:dict = data['audioFileMetadata']
+            audiotype: str = item['audioFileType']
+            audiometadata: dict = item['audioFileMetadata']
 
         except KeyError as key:
-            response = generate_400_response(f"{key} is required")
-            return response,400
+            response = generate_400_response(f"item {count} - {key} is required")
+            return response, 400
 
-        if not isinstance(audiotype):
-            response = generate_400_response("'audioFileType' must be an string")
-            return response,400
+        if not isinstance(audiotype, str):
+            response = generate_400_response(f"item {count} - 'audioFileType' must be an str")
+            return response, 400
 
-        if not isinstance(audiometadata):
-            response = generate_400_response("'audioFileMetadata' must be an dict")
-            return response,400
+        if not isinstance(audiometadata, dict):
+            response = generate_400_response(f"item {count} - 'audioFileMetadata' must be a dict")
+            return response, 400
 
-        try:
-            audiotype = audiotype.capitalize()
-            audiofile = new_audio(audiotype,audiometadata)
+        audiotype = _canon_type(audiotype)
 
-            if not audiofile:
-                response = generate_400_response(f"'{audiofile}' is not supported")
-                return response,400
+        if audiotype not in _AUDIO_TYPES:
+            response = generate_400_response(f"item {count} - '{audiotype}' is not supported")
+            return response, 400
+
+        try:
+            audiofile = new_audio(audiotype, audiometadata)
 
         except MetadataValueError as error:
-            response = generate_400_response(f"{error}")
+            response = generate_400_response(f"item {count} - {error}")
             return response, 400
 
         except MetadataGenerationError as error:
-            response = generate_500_response(f"metadata generation for {audiotype} - {error}")
+            response = generate_500_response(f"item {count} - metadata generation for {audiotype} - {error}")
             return response, 500
 
-        insert_result = collection.insert_one(audiofile.metadata)
+        audiofiles.append(audiofile)
 
-        if not insert_result.acknowledged:
-            response = generate_500_response("database insertion failed")
-            return response, 500
+    if not audiofiles:
+        response = generate_400_response("at least one audio file is required")
+        return response, 400
 
-        return {"status":200,"message":"Creation Completed","result":f"{audiotype} file with ID {insert_result.inserted_id} has been created",
-                "document":insert_result.inserted_id},200
+    documents = [audiofile.metadata for audiofile in audiofiles]
 
-class Delete(Resource):
-    """ Resource for deleting audio files from the server """
-    def get(self,audiotype:str,audioID:int):
-        audiotype = audiotype.capitalize()
+    try:
+        insert_result = collection.insert_many(documents, ordered=False)
+
+    except BulkWriteError as error:
+        # An unordered insert still writes every document that didn't fail, so report those
+        # alongside the per-item errors to let the client retry only the failed items
+        write_errors = error.details.get('writeErrors', [])
+        concern_errors = error.details.get('writeConcernErrors', [])
+        failed = {write_error['index'] for write_error in write_errors}
+        inserted = [document['_id'] for index, document in enumerate(documents) if index not in failed]
+
+        message = f"database insertion failed for {len(write_errors)} document(s)"
+        if concern_errors:
+            message += f" with {len(concern_errors)} write concern error(s)"
+
+        # Only duplicate keys (code 11000) are the client's fault, anything else is the server's
+        if write_errors and not concern_errors and all(write_error['code'] == 11000 for write_error in write_errors):
+            response, status = generate_400_response(message), 400
+        else:
+            response, status = generate_500_response(message), 500
 
-        if audiotype.lower() not in ['song','podcast','audiobook']:
-            response = generate_400_response(f"'{audiotype}' is not supported")
-            return response,400
+        # A write concern error can stop the run part way, so only claim per document success
+        # when the inserted IDs account for exactly what the server reports as inserted
+        if len(inserted) == error.details.get('nInserted'):
+            response['documents'] = inserted
+        else:
+            response['inserted'] = error.details.get('nInserted', 0)
 
-        try:
-            search_fil = {'type':audiotype,'_id':audioID}
-            delete_res = collection.find_one_and_delete(search_fil)
+        response['errors'] = [{'item': write_error['index'] + 1, 'error': write_error['errmsg']}
+                              for write_error in write_errors]
+        return response, status
 
-        except Exception as error:
-            response = generate_500_response(f"database query and delete failed - {error}")
-            return response,500
+    except Exception as error:
+        response = generate_500_response(f"database insertion failed - {error}")
+        return response, 500
 
-        if not delete_res:
-            return {'status': 200, 'message': 'Delete Completed','result':f"No document deleted"},200
+    return {"status": 200, "message": "Creation Completed",
+            "result": f"{len(insert_result.inserted_ids)} file(s) have been created",
+            "documents": insert_result.inserted_ids}, 200
 
-        return {'status': 200, 'message': 'Delete Completed','result':f"{audiotype} file with ID {delete_res['_id']}",
-                'document':delete_res['_id']},200
+@app.route('/delete/<string:audiotype>/<int:audioID>')
+def delete(audiotype:str,audioID:int):
+    """ View for deleting audio files from the server """
+    audiotype = _canon_type(audiotype)
 
-class Update(Resource):
-    """ Resource for updating audio files on the server """
-    def post(self,audiotype:str, audioID:int):
-        audiotype = audiotype.capitalize()
+    if audiotype not in _AUDIO_TYPES:
+        response = generate_400_response(f"'{audiotype}' is not supported")
+        return response,400
 
-        if audiotype.lower() not in ['song','podcast','audiobook']:
-            response = generate_400_response(f"'{audiotype}' is not supported")
-            return response,400
+    try:
+        search_fil = {'type':audiotype,'_id':audioID}
+        delete_res = collection.find_one_and_delete(search_fil, projection={'_id': 1})
 
-        data = request.get_json()
+    except Exception as error:
+        response = generate_500_response(f"database query and delete failed - {error}")
+        return response,500
 
-        try:
-            audiotyp_param: str = data['audioFileType']
-            audiometadata:dict = data['audioFileMetadata']
+    if not delete_res:
+        return {'status': 200, 'message': 'Delete Completed','result':f"No document deleted"},200
 
-        except KeyError as key:
-            response = generate_400_response()(f"{key} is required")
-            return response, 400
+    return {'status': 200, 'message': 'Delete Completed','result':f"{audiotype} file with ID {delete_res['_id']}",
+            'document':delete_res['_id']},200
 
-        if not isinstance(audiotyp_param, str):
-            response = generate_400_response("'audioFileType' must be an str")
-            return response, 400
+@app.route('/update/<string:audiotype>/<int:audioID>', methods=['POST'])
+def update(audiotype:str, audioID:int):
+    """ View for updating audio files on the server """
+    audiotype = _canon_type(audiotype)
 
-        if not isinstance(audiometadata, dict):
-            response = generate_400_response("'audioFileMetadata' must be a dict")
-            return response, 400
+    if audiotype not in _AUDIO_TYPES:
+        response = generate_400_response(f"'{audiotype}' is not supported")
+        return response,400
 
-        if audiotyp_param.capitalize() != audiotype:
-            response = generate_400_response("'audioFileType' must match endpoint")
-            return response, 400
+    data = request.get_json(cache=True)
 
-        try:
-            search_filter = {'type':audiotype,'_id':audioID}
-            old_doc = collection.find_one(search_filter)
+    if not isinstance(data, dict):
+        response = generate_400_response("request body must be a dict")
+        return response, 400
 
-        except Exception as error:
-            response = generate_500_response(f"database query failed - {error}")
-            return response, 500
+    try:
+        audiotyp_param: str = data['audioFileType']
+        audiometadata:dict = data['audioFileMetadata']
 
-        if not old_doc:
-            response = generate_400_response(f"No document found for ID - {audioID}")
-            return response, 400
+    except KeyError as key:
+        response = generate_400_response(f"{key} is required")
+        return response, 400
 
-        try:
-            new_audiofile = new_audio(audiotype, audiometadata)
+    if not isinstance(audiotyp_param, str):
+        response = generate_400_response("'audioFileType' must be an str")
+        return response, 400
 
-            if not new_audiofile:
-                response = generate_400_response(f"'{audiotype}' is not supported")
-                return response, 400
+    if not isinstance(audiometadata, dict):
+        response = generate_400_response("'audioFileMetadata' must be a dict")
+        return response, 400
 
-            new_document = new_audiofile.metadata
-            new_document['_id'] = old_doc['_id']
+    if _canon_type(audiotyp_param) != audiotype:
+        response = generate_400_response("'audioFileType' must match endpoint")
+        return response, 400
 
-        except MetadataValueError as error:
-            response = generate_400_response(f"{error}")
-            return response, 400
+    try:
+        new_audiofile = new_audio(audiotype, audiometadata)
+        new_document = new_audiofile.metadata
+        new_document['_id'] = audioID
 
-        except MetadataGenerationError as error:
-            response = generate_500_response(f"metadata generation for {audiotype} - {error}")
-            return response, 500
+    except MetadataValueError as error:
+        response = generate_400_response(f"{error}")
+        return response, 400
 
-        except Exception as error:
-            response = generate_500_response(f"document update failed - {error}")
-            return response, 500
+    except MetadataGenerationError as error:
+        response = generate_500_response(f"metadata generation for {audiotype} - {error}")
+        return response, 500
 
-        try:
-            pre_update_doc = collection.find_one_and_replace(search_filter, new_document)
+    except Exception as error:
+        response = generate_500_response(f"document update failed - {error}")
+        return response, 500
 
-        except Exception as error:
-            response = generate_500_response(f"database query and replace failed - {error}")
-            return response, 500
+    try:
+        search_filter = {'type':audiotype,'_id':audioID}
+        pre_update_doc = collection.find_one_and_replace(search_filter, new_document,
+                                                         return_document=ReturnDocument.BEFORE, upsert=False)
+
+    except Exception as error:
+        response = generate_500_response(f"database query and replace failed - {error}")
+        return response, 500
+
+    if not pre_update_doc:
+        response = generate_400_response(f"No document found for ID - {audioID}")
+        return response, 400
+
+    return {
+        "status": 200,
+        "message": "Update Complete",
+        "result": f"{audiotype} file with ID {audioID} has been updated",
+        "pre-update": pre_update_doc,
+        "post-update": new_document,
+        "document": audioID
+    }, 200
+
+@app.route('/get/<string:audiotype>')
+@app.route('/get/<string:audiotype>/<int:audioID>')
+def get(audiotype: str, audioID: int = None):
+    """ View for retrieving audio files from the server """
+    audiotype = _canon_type(audiotype)
+
+    if audiotype not in _AUDIO_TYPES:
+        response = generate_400_response(f"'{audiotype}' is not supported")
+        return response, 400
 
-        return {
-            "status": 200,
-            "message": "Update Complete",
-            "result": f"{audiotype} file with ID {audioID} has been updated",
-            "pre-update": pre_update_doc,
-            "post-update": new_document,
-            "document": audioID
-        }, 200
-
-class Get(Resource):
-    """ Resource for retrieving audio files from the server """
-    def get(self, audiotype: str, audioID: int = None):
-        """ RESTful GET Method. """
-        audiotype = audiotype.capitalize()
-
-        if audiotype.lower() not in ['song', 'podcast', 'audiobook']:
-            response = generate_400_response(f"'{audiotype}' is not supported")
-            return response, 400
+    try:
+        if audioID:
+            result = read_batched(audiotype, audioID)
+            result = [result] if result else []
+        else:
+            search = {"type": audiotype}
+            search_result = collection.find(search).batch_size(500)
+            result = list(search_result)
+
+    except Exception as error:
+        response = generate_500_response(f"database query failed - {error}")
+        return response, 500
+
+    # The ETag is derived from the documents themselves, so any write that changes them changes it
+    etag = hashlib.blake2b(repr(result).encode(), digest_size=16).hexdigest()
+    headers = {'ETag': f'"{etag}"'}
+
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, headers
+
+    return {
+        "status": 200,
+        "message": "Get Complete",
+        "result": f"{len(result)} result(s) found",
+        "documents": result,
+        "matches": len(result)
+    }, 200, headers
+
+
+@app.route('/get-stream/<string:audiotype>')
+def get_stream(audiotype: str):
+    """ View for streaming all audio files of a type as newline delimited JSON, one document
+    per line, for result sets too large to buffer into a single response """
+    audiotype = _canon_type(audiotype)
+
+    if audiotype not in _AUDIO_TYPES:
+        response = generate_400_response(f"'{audiotype}' is not supported")
+        return response, 400
+
+    # The cursor is lazy, so fetch the first batch now: once the response starts streaming
+    # its 200 status has been sent and a database error can no longer be reported
+    try:
+        search_result = collection.find({"type": audiotype}).batch_size(500)
+        first = next(search_result, None)
 
-        try:
-            if audioID:
-                search = {"type": audiotype, "_id": audioID}
-                result = collection.find_one(search)
-                result = [result] if result else []
-            else:
-                search = {"type": audiotype}
-                search_result = collection.find(search)
-                result = [res for res in search_result]
-
-        except Exception as error:
-            response = generate_500_response(f"database query failed - {error}")
-            return response, 500
+    except Exception as error:
+        response = generate_500_response(f"database query failed - {error}")
+        return response, 500
+
+    def generate():
+        if first is None:
+            return
+
+        yield orjson.dumps(first, default=app.json.default) + b'\n'
+        for document in search_result:
+            yield orjson.dumps(document, default=app.json.default) + b'\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
 
-        return {
-            "status": 200,
-            "message": "Get Complete",
-            "result": f"{len(result)} result(s) found",
-            "documents": result,
-            "matches": len(result)
-        }, 200
-
-api.add_resource(Create, '/create')
-api.add_resource(Delete, '/delete/<string:audiotype>/<int:audioID>')
-api.add_resource(Update, '/update/<string:audiotype>/<int:audioID>')
-api.add_resource(Get, '/get/<string:audiotype>', '/get/<string:audiotype>/<int:audioID>')
 
 if __name__ == '__main__':
     app.run()
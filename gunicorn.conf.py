@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration for the audio server.
+Run with ``gunicorn wsgi:app`` from the project root.
+"""
+
+# gevent workers serve many requests concurrently, switching greenlets while they wait on MongoDB.
+# worker_connections is kept equal to the MongoClient maxPoolSize in audioserver.py (keep them in sync):
+# with more greenlets than pooled connections, a burst would queue on the pool and fail with
+# WaitQueueTimeoutError after waitQueueTimeoutMS. The trade-off is that requests past 50 per worker
+# wait in the listen backlog instead, even if they would never touch MongoDB.
+worker_class = 'gevent'
+workers = 4
+worker_connections = 50
+
+# Keep a few MongoDB connections warm in every serving worker.
+raw_env = ['AUDIO_SERVER_MIN_POOL_SIZE=5']
+
+# MongoClient is not fork-safe, so each worker must import the app (and create its client) itself.
+preload_app = False
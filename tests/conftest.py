@@ -0,0 +1,26 @@
+import mongomock
+import pytest
+
+import audioserver
+
+
+@pytest.fixture(autouse=True)
+def mongo_client(monkeypatch):
+    """ An in-memory client swapped in for the server's MongoDB client, so no test talks to MongoDB """
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(audioserver, 'client', client)
+    return client
+
+
+@pytest.fixture
+def collection(mongo_client, monkeypatch):
+    """ An in-memory audiofiles collection swapped in for the server's MongoDB collection """
+    collection = mongo_client['AudioServer']['audiofiles']
+    monkeypatch.setattr(audioserver, 'collection', collection)
+    return collection
+
+
+@pytest.fixture
+def client(collection):
+    """ A Flask test client for the audio server, backed by the in-memory collection """
+    return audioserver.app.test_client()
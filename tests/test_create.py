@@ -0,0 +1,24 @@
+import pytest
+
+
+def test_creates_a_song(client, collection):
+    response = client.post('/create', json={'audioFileType': 'song',
+                                            'audioFileMetadata': {'name': 'song', 'duration': 10}})
+
+    assert response.status_code == 200
+    assert collection.find_one({'_id': response.json['document']})['type'] == 'Song'
+
+
+@pytest.mark.parametrize('body', ['[1]', '"song"', 'null'])
+def test_non_object_body_is_a_bad_request(client, collection, body):
+    response = client.post('/create', data=body, content_type='application/json')
+
+    assert response.status_code == 400
+    assert response.json['error'] == "request body must be a dict"
+
+
+def test_malformed_body_uses_the_json_envelope(client, collection):
+    response = client.post('/create', data='{', content_type='application/json')
+
+    assert response.status_code == 400
+    assert response.json['message'] == 'Bad Request'
@@ -0,0 +1,69 @@
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import audioserver
+
+
+def batch_item(name, audiotype='song'):
+    return {'audioFileType': audiotype, 'audioFileMetadata': {'name': name, 'duration': 10}}
+
+
+def test_creates_every_item_with_one_write(client, collection):
+    response = client.post('/create-batch', json=[batch_item('first'), batch_item('second')])
+
+    assert response.status_code == 200
+    assert sorted(response.json['documents']) == sorted(doc['_id'] for doc in collection.find())
+    assert collection.count_documents({'type': 'Song'}) == 2
+
+
+def test_invalid_item_is_rejected_before_writing(client, collection):
+    response = client.post('/create-batch', json=[batch_item('first'), batch_item('second', 'film')])
+
+    assert response.status_code == 400
+    assert response.json['error'] == "item 2 - 'Film' is not supported"
+    assert collection.count_documents({}) == 0
+
+
+def test_duplicate_keys_report_inserted_ids_and_per_item_errors(client, collection):
+    existing = client.post('/create', json=batch_item('existing')).json['document']
+    duplicate = batch_item('existing')
+    duplicate['audioFileMetadata']['_id'] = existing
+
+    response = client.post('/create-batch', json=[duplicate, batch_item('new')])
+
+    assert response.status_code == 400
+    assert response.json['documents'] == [collection.find_one({'name': 'new'})['_id']]
+    assert [error['item'] for error in response.json['errors']] == [1]
+
+
+def test_database_errors_use_the_500_envelope(client, collection, monkeypatch):
+    def insert_many(*args, **kwargs):
+        raise AutoReconnect("connection lost")
+
+    monkeypatch.setattr(audioserver.collection, 'insert_many', insert_many)
+
+    response = client.post('/create-batch', json=[batch_item('first')])
+
+    assert response.status_code == 500
+    assert response.json['error'] == "database insertion failed - connection lost"
+
+
+def test_empty_audio_type_is_reported_as_given(client, collection):
+    response = client.post('/create-batch', json=[batch_item('first', '')])
+
+    assert response.status_code == 400
+    assert response.json['error'] == "item 1 - '' is not supported"
+
+
+def test_write_concern_errors_are_server_errors(client, collection, monkeypatch):
+    def insert_many(documents, *args, **kwargs):
+        raise BulkWriteError({'writeErrors': [], 'writeConcernErrors': [{'code': 64, 'errmsg': 'waiting for replication timed out'}],
+                              'nInserted': 0, 'nUpserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []})
+
+    monkeypatch.setattr(audioserver.collection, 'insert_many', insert_many)
+
+    response = client.post('/create-batch', json=[batch_item('first'), batch_item('second')])
+
+    assert response.status_code == 500
+    assert response.json['error'] == "database insertion failed for 0 document(s) with 1 write concern error(s)"
+    assert 'documents' not in response.json
+    assert response.json['inserted'] == 0
@@ -0,0 +1,45 @@
+def create_song(client, name='song'):
+    return client.post('/create', json={'audioFileType': 'song',
+                                        'audioFileMetadata': {'name': name, 'duration': 10}})
+
+
+def test_get_sends_an_etag(client, collection):
+    create_song(client)
+
+    response = client.get('/get/song')
+
+    assert response.status_code == 200
+    assert response.json['matches'] == 1
+    assert response.headers['ETag'].startswith('"')
+
+
+def test_matching_etag_returns_304(client, collection):
+    create_song(client)
+    etag = client.get('/get/song').headers['ETag']
+
+    response = client.get('/get/song', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_weak_etag_returns_304(client, collection):
+    create_song(client)
+    etag = client.get('/get/song').headers['ETag']
+
+    response = client.get('/get/song', headers={'If-None-Match': f"W/{etag}"})
+
+    assert response.status_code == 304
+
+
+def test_etag_changes_after_a_write(client, collection):
+    create_song(client)
+    etag = client.get('/get/song').headers['ETag']
+    create_song(client, 'another song')
+
+    response = client.get('/get/song', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.json['matches'] == 2
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,81 @@
+import decimal
+
+import orjson
+from pymongo.errors import AutoReconnect
+
+import audioserver
+
+
+class FailingCursor:
+    """ A cursor that fails when its first batch is fetched, like a lazy PyMongo cursor """
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raise AutoReconnect("connection lost")
+
+
+class ListCursor:
+    """ A cursor over a fixed list of documents """
+
+    def __init__(self, documents):
+        self.documents = iter(documents)
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.documents)
+
+
+def test_streams_one_document_per_line(client, collection):
+    for name in ('first', 'second', 'third'):
+        client.post('/create', json={'audioFileType': 'song', 'audioFileMetadata': {'name': name, 'duration': 10}})
+
+    response = client.get('/get-stream/song')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.data.splitlines()
+    assert [orjson.loads(line)['name'] for line in lines] == ['first', 'second', 'third']
+
+
+def test_no_matches_stream_an_empty_body(client, collection):
+    response = client.get('/get-stream/podcast')
+
+    assert response.status_code == 200
+    assert response.data == b''
+
+
+def test_unsupported_type_is_rejected(client, collection):
+    response = client.get('/get-stream/film')
+
+    assert response.status_code == 400
+    assert response.json['error'] == "'Film' is not supported"
+
+
+def test_database_errors_use_the_500_envelope(client, collection, monkeypatch):
+    monkeypatch.setattr(audioserver.collection, 'find', lambda *args, **kwargs: FailingCursor())
+
+    response = client.get('/get-stream/song')
+
+    assert response.status_code == 500
+    assert response.json['error'] == "database query failed - connection lost"
+
+
+def test_streams_values_get_can_serialize(client, collection, monkeypatch):
+    documents = [{'_id': 1, 'name': 'first', 'rating': decimal.Decimal('4.5')},
+                 {'_id': 2, 'name': 'second', 'rating': decimal.Decimal('3')}]
+    monkeypatch.setattr(audioserver.collection, 'find', lambda *args, **kwargs: ListCursor(documents))
+
+    response = client.get('/get-stream/song')
+
+    assert response.status_code == 200
+    assert [orjson.loads(line)['rating'] for line in response.data.splitlines()] == ['4.5', '3']
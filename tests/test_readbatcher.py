@@ -0,0 +1,89 @@
+import threading
+
+from audio import Song, Podcast
+from audioserver import ReadBatcher
+
+
+class RecordingCollection:
+    """ Wraps a collection and records the filter of every 'find' sent to it """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.queries = []
+
+    def find(self, search):
+        self.queries.append(search)
+        return self.collection.find(search)
+
+
+class FailingCollection:
+    """ A collection whose every 'find' fails """
+
+    def find(self, search):
+        raise RuntimeError("database unavailable")
+
+
+def run_concurrently(batcher, lookups):
+    """ Runs each (audiotype, audioID) lookup on its own thread and returns the results
+    (or raised exceptions) in the same order """
+    results = [None] * len(lookups)
+    barrier = threading.Barrier(len(lookups))
+
+    def lookup(index, audiotype, audioID):
+        barrier.wait()
+        try:
+            results[index] = batcher.find_one(audiotype, audioID)
+        except Exception as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=lookup, args=(index, *args)) for index, args in enumerate(lookups)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def test_concurrent_lookups_collapse_into_one_query_per_type(collection):
+    songs = [Song({'name': f"song {i}", 'duration': 10}).metadata for i in range(12)]
+    podcasts = [Podcast({'name': f"podcast {i}", 'duration': 10, 'host': 'host'}).metadata for i in range(12)]
+    collection.insert_many(songs + podcasts)
+
+    recorder = RecordingCollection(collection)
+    batcher = ReadBatcher(recorder, window=0.2)
+    lookups = [('Song', doc['_id']) for doc in songs] + [('Podcast', doc['_id']) for doc in podcasts]
+
+    results = run_concurrently(batcher, lookups)
+
+    assert [doc['_id'] for doc in results] == [audioID for _, audioID in lookups]
+    assert sorted(query['type'] for query in recorder.queries) == ['Podcast', 'Song']
+    assert all(len(query['_id']['$in']) == 12 for query in recorder.queries)
+
+
+def test_missing_documents_resolve_to_none(collection):
+    song = Song({'name': 'song', 'duration': 10}).metadata
+    collection.insert_one(song)
+    batcher = ReadBatcher(collection, window=0.2)
+
+    results = run_concurrently(batcher, [('Song', song['_id']), ('Song', 1), ('Podcast', song['_id'])])
+
+    assert results[0]['_id'] == song['_id']
+    assert results[1:] == [None, None]
+
+
+def test_query_errors_reach_every_waiter():
+    batcher = ReadBatcher(FailingCollection(), window=0.2)
+
+    results = run_concurrently(batcher, [('Song', 1), ('Song', 2), ('Podcast', 3)])
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_sequential_lookups_reuse_the_flusher_thread(collection):
+    batcher = ReadBatcher(collection)
+
+    assert batcher.find_one('Song', 1) is None
+    flusher = batcher._flusher
+    assert batcher.find_one('Song', 2) is None
+    assert batcher._flusher is flusher
@@ -0,0 +1,36 @@
+def song(name, duration=10):
+    return {'audioFileType': 'song', 'audioFileMetadata': {'name': name, 'duration': duration}}
+
+
+def test_updates_an_existing_document(client, collection):
+    audioID = client.post('/create', json=song('before')).json['document']
+
+    response = client.post(f"/update/song/{audioID}", json=song('after', 20))
+
+    assert response.status_code == 200
+    assert response.json['pre-update']['name'] == 'before'
+    assert response.json['post-update']['_id'] == audioID
+    assert collection.find_one({'_id': audioID})['name'] == 'after'
+    assert collection.count_documents({}) == 1
+
+
+def test_missing_document_is_a_bad_request(client, collection):
+    response = client.post('/update/song/1', json=song('after'))
+
+    assert response.status_code == 400
+    assert response.json['error'] == "No document found for ID - 1"
+    assert collection.count_documents({}) == 0
+
+
+def test_invalid_metadata_is_reported_before_a_missing_document(client, collection):
+    response = client.post('/update/song/1', json=song('after', -1))
+
+    assert response.status_code == 400
+    assert response.json['error'] == "metadata value is invalid for 'duration' - not positive"
+
+
+def test_non_object_body_is_a_bad_request(client, collection):
+    response = client.post('/update/song/1', json=[1])
+
+    assert response.status_code == 400
+    assert response.json['error'] == "request body must be a dict"
@@ -0,0 +1,11 @@
+"""
+WSGI entrypoint for serving the audio server with gevent.
+gunicorn's gevent worker already monkey patches the standard library before loading the app;
+patching here as well (a no-op under gunicorn) covers launching the app under other WSGI servers,
+where it must happen before pymongo is imported so its sockets yield to other greenlets.
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+from audioserver import app  # noqa: E402